@@ -3,124 +3,398 @@ import pandas as pd
 import joblib
 import numpy as np
 import os
+import gc
+import ctypes
+import hashlib
+import json
+import threading
 from datetime import datetime
 
+# Optional accelerated backends (see convert_model.py)
+try:
+    import tl2cgen
+except ImportError:
+    tl2cgen = None
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
 # CONFIGURATION & UTILS
 st.set_page_config(page_title="Car Price Estimator", layout="centered")
 MODEL_FILENAME = "car_price_model_rf.pkl"
-CURRENT_YEAR = datetime.now().year
+ONNX_MODEL_FILENAME = "car_price_model_rf.onnx"
+COMPILED_MODEL_FILENAME = "car_price_model_rf.so"
+COMPILED_DIGEST_FILENAME = COMPILED_MODEL_FILENAME + ".sha256"
+BRAND_ENCODING_FILENAME = "car_price_brand_encoding.json"
+# sklearn trees compare in float32 and the ONNX/compiled forests only accept it,
+# so the input row is built in float32 from the start (no float64 round trip)
+FEATURE_DTYPE = np.float32
+PARALLEL_ROWS_PER_JOB = 2048
+CATEGORICAL_FEATURES = ("Fuel_Type", "Transmission", "Owner_Type", "Brand")
+MIN_YEAR = 1990
+COMPARE_YEARS_SPAN = 2
+
+class CompiledPredictor:
+    """
+    Wrapper around the forest compiled to native code by Treelite/TL2cgen,
+    exposing predict(X) like the sklearn model.
+    """
+    def __init__(self, predictor):
+        self.predictor = predictor
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
+        return self.predictor.predict(tl2cgen.DMatrix(X)).ravel()
+
+def load_compiled_predictor(feature_names, model_digest):
+    """
+    Loading the natively compiled forest if it exists and tl2cgen is installed.
+    A library whose sidecar digest doesn't match the pickled model (or is
+    missing), or that was built for a different feature count, is stale
+    and skipped.
+    """
+    if tl2cgen is None or not os.path.exists(COMPILED_MODEL_FILENAME):
+        return None
+    try:
+        with open(COMPILED_DIGEST_FILENAME) as f:
+            library_digest = f.read().strip()
+    except OSError:
+        library_digest = None
+    if library_digest != model_digest:
+        st.warning(f"'{COMPILED_MODEL_FILENAME}' was not built from the current '{MODEL_FILENAME}', falling back.")
+        return None
+
+    try:
+        predictor = tl2cgen.Predictor(os.path.abspath(COMPILED_MODEL_FILENAME))
+    except Exception as e:
+        st.warning(f"Could not load '{COMPILED_MODEL_FILENAME}', falling back: {str(e)}")
+        return None
+
+    if predictor.num_feature != len(feature_names):
+        st.warning(f"'{COMPILED_MODEL_FILENAME}' does not match '{MODEL_FILENAME}', falling back.")
+        return None
+    return CompiledPredictor(predictor)
+
+def file_digest(path):
+    """
+    SHA-256 of a file, read in chunks; matched against the digest that
+    convert_model.py records next to each converted artifact.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class OnnxPredictor:
+    """
+    Thin wrapper giving an ONNX Runtime session the same predict(X)
+    interface as the sklearn model.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
+        return self.session.run(None, {self.input_name: X})[0].ravel()
+
+def load_onnx_predictor(feature_names, model_digest):
+    """
+    Loading the converted forest if it exists and onnxruntime is installed.
+    The pickle digest and feature names stored in the ONNX metadata must match
+    the pickled model, otherwise the artifact is stale and is skipped.
+    """
+    if ort is None or not os.path.exists(ONNX_MODEL_FILENAME):
+        return None
+    try:
+        session = ort.InferenceSession(ONNX_MODEL_FILENAME, providers=["CPUExecutionProvider"])
+    except Exception as e:
+        st.warning(f"Could not load '{ONNX_MODEL_FILENAME}', falling back: {str(e)}")
+        return None
+
+    metadata = session.get_modelmeta().custom_metadata_map
+    if (metadata.get("model_sha256") != model_digest
+            or json.loads(metadata.get("feature_names", "[]")) != feature_names.tolist()):
+        st.warning(f"'{ONNX_MODEL_FILENAME}' does not match '{MODEL_FILENAME}', falling back.")
+        return None
+    return OnnxPredictor(session)
+
+class SklearnPredictor:
+    """
+    Fallback that feeds the sklearn forest through a 1-row DataFrame template
+    built once, so feature names are kept without constructing a new frame
+    on every click. Only the cells that changed are mutated via .iat.
+    """
+    def __init__(self, model, feature_names):
+        self.model = model
+        self.template = pd.DataFrame(np.zeros((1, len(feature_names)), dtype=FEATURE_DTYPE), columns=feature_names)
+        self.filled = np.empty(0, dtype=np.intp)
+        # The template (and model.n_jobs below) is shared by all sessions of the process
+        self.lock = threading.Lock()
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
+        with self.lock:
+            # Spinning up joblib workers costs more than walking the trees for a
+            # handful of rows, so only large batches get parallelized
+            self.model.n_jobs = max(1, min(os.cpu_count() or 1, X.shape[0] // PARALLEL_ROWS_PER_JOB))
+            if X.shape[0] != 1:
+                # Wraps the float32 array as is; sklearn then skips its float64 -> float32 copy
+                return self.model.predict(pd.DataFrame(X, columns=self.template.columns, copy=False))
+            for idx in self.filled:
+                self.template.iat[0, idx] = 0.0
+            self.filled = np.flatnonzero(X[0])
+            for idx in self.filled:
+                self.template.iat[0, idx] = X[0, idx]
+            return self.model.predict(self.template)
+
+def release_memory():
+    """
+    Collecting freed objects and, on glibc, handing the freed heap back to
+    the OS; without malloc_trim the RSS stays at its peak after a del.
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass  # Not glibc (macOS/Windows); gc.collect() is all we can do
+
+def load_brand_encoding(feature_index):
+    """
+    Loading the compact brand encoding learned offline for a model trained on
+    binary/target-encoded brands instead of one Brand_ column per brand.
+    Format: {"columns": ["Brand_bin_0", ...], "brands": {"Audi": [0, 1, ...], ...}}
+    Returns {brand: (column positions, values)} or None if not shipped.
+    """
+    if not os.path.exists(BRAND_ENCODING_FILENAME):
+        return None
+    try:
+        with open(BRAND_ENCODING_FILENAME) as f:
+            encoding = json.load(f)
+        if not isinstance(encoding, dict) or not isinstance(encoding.get("brands"), dict):
+            raise ValueError('expected an object with a "brands" mapping')
+        if not encoding["brands"]:
+            raise ValueError("no brands listed")
+        indices = np.array([feature_index[c] for c in encoding["columns"]], dtype=np.intp)
+
+        # Every vector must fill exactly the encoded columns, or the click-time
+        # row assignment would fail with a shape mismatch
+        brand_encoding = {}
+        for brand, values in encoding["brands"].items():
+            values = np.asarray(values, dtype=FEATURE_DTYPE)
+            if values.shape != indices.shape:
+                raise ValueError(f"'{brand}' has {values.size} values for {indices.size} columns")
+            brand_encoding[brand] = (indices, values)
+        return brand_encoding
+    except (ValueError, KeyError, TypeError) as e:
+        st.warning(f"'{BRAND_ENCODING_FILENAME}' does not match '{MODEL_FILENAME}', using one-hot brands: {str(e)}")
+        return None
 
 @st.cache_resource
 def load_model():
+    """
+    Loading the model once per process and precomputing everything derived
+    from its feature schema, so Streamlit reruns don't rescan it.
+    Returns (model, feature_names, brands, feature_index, category_index,
+    brand_encoding) or None, where model is the fastest available predictor: compiled
+    forest, then ONNX, then the sklearn forest itself.
+    """
     if not os.path.exists(MODEL_FILENAME):
         st.error(f"Critical Error: '{MODEL_FILENAME}' not found.")
         return None
     try:
         model = joblib.load(MODEL_FILENAME)
-        return model
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None
 
-def extract_brands_from_model(model):
+    # All feature names the model expects, in training order
+    feature_names = np.asarray(model.feature_names_in_)
+
+    # Fixed-width byte strings (|S<n>) let np.char scan name prefixes in C
+    # instead of going through one Python str object per feature
+    names_bytes = np.char.encode(feature_names.astype(str), 'utf-8')
+
+    # Brand dropdown: 'Brand_Audi' -> 'Audi', selected with a vectorized prefix mask
+    brand_features = names_bytes[np.char.startswith(names_bytes, b'Brand_')]
+    brands = np.char.decode(np.sort(np.char.replace(brand_features, b'Brand_', b'', count=1)), 'utf-8').tolist()
+
+    # Column name -> position in the model's input row
+    feature_index = {name: i for i, name in enumerate(feature_names.tolist())}
+
+    # Categorical value -> one-hot column position, e.g. category_index['Fuel_Type']['Diesel']
+    category_index = {}
+    for feature in CATEGORICAL_FEATURES:
+        prefix = feature + '_'
+        positions = np.flatnonzero(np.char.startswith(names_bytes, prefix.encode('utf-8')))
+        category_index[feature] = {feature_names[i][len(prefix):]: int(i) for i in positions}
+
+    # Brand -> (column positions, values) to write into the row: a single 1.0
+    # for one-hot models, or the few columns of a shipped compact encoding
+    brand_encoding = load_brand_encoding(feature_index)
+    if brand_encoding is None:
+        one_hot = np.ones(1, dtype=FEATURE_DTYPE)
+        brand_encoding = {brand: (np.array([i]), one_hot) for brand, i in category_index['Brand'].items()}
+    else:
+        brands = sorted(brand_encoding)
+
+    # Prefer an accelerated forest: same trees, no per-tree Python dispatch
+    # Artifacts built from an older pickle (even with the same columns) are skipped
+    model_digest = file_digest(MODEL_FILENAME)
+    for load_predictor in (load_compiled_predictor, load_onnx_predictor):
+        predictor = load_predictor(feature_names, model_digest)
+        if predictor is not None:
+            # Only the compact runtime is kept; free the pickled estimators' tree arrays
+            del model
+            release_memory()
+            break
+    else:
+        predictor = SklearnPredictor(model, feature_names)
+
+    # Warm-up: one dummy predict faults in the tree arrays and pays one-time
+    # initialization here instead of on the user's first click
+    try:
+        predictor.predict(np.zeros((1, len(feature_names)), dtype=FEATURE_DTYPE))
+    except Exception as e:
+        st.warning(f"Model warm-up failed: {str(e)}")
+
+    return predictor, feature_names, brands, feature_index, category_index, brand_encoding
+
+@st.cache_resource(ttl=3600)
+def get_current_year():
     """
-    Dynamically finding all 'Brand_' features the model was trained on
-    to populate the dropdown list automatically.
+    Reading the clock (and its timezone lookup) at most once an hour instead
+    of on every rerun; the TTL still lets a long-lived process roll over.
     """
-    try:
-        # Get all feature names the model expects
-        model_features = model.feature_names_in_
-        
-        # Filter for columns that start with 'Brand_'
-        brand_features = [f for f in model_features if f.startswith('Brand_')]
-        
-        # Clean up strings: 'Brand_Audi' -> 'Audi'
-        brands = [f.replace('Brand_', '') for f in brand_features]
-        return sorted(brands)
-    except AttributeError:
-        st.warning("Could not extract brands automatically. Using default list.")
-        return ["Maruti", "Hyundai", "Honda", "Toyota", "Mercedes-Benz", "Volkswagen", "Ford", "Mahindra", "BMW", "Audi", "Tata"]
+    return datetime.now().year
+
+@st.cache_data(max_entries=256)
+def cached_predict(_model, features):
+    """
+    Memoizing single-row predictions on the feature tuple, so repeating an
+    input combination skips walking every tree of the forest again.
+    Only worth it for the sklearn fallback: hashing the ~750-float tuple
+    costs more than a whole ONNX/compiled predict.
+    (_model is not hashed; there is only one model per process.)
+    """
+    row = np.asarray(features, dtype=FEATURE_DTYPE).reshape(1, -1)
+    return float(_model.predict(row)[0])
 
 # UI & LOGIC
 def main():
     st.title("🚗 Car Price Estimator (Enterprise Edition)")
     st.markdown("Enter vehicle details to estimate market value.")
 
-    # 1. Load Model
-    model = load_model()
-    if model is None:
+    # 1. Load Model (cached together with its feature schema)
+    loaded = load_model()
+    if loaded is None:
         st.stop()
+    model, model_columns, available_brands, feature_index, category_index, brand_encoding = loaded
+    current_year = get_current_year()
 
-    # 2. Get Dynamic Brand List
-    available_brands = extract_brands_from_model(model)
-
-    # 3. User Inputs
-    st.sidebar.header("Vehicle Details")
-    
-    # Critical Missing Input: Brand
-    brand = st.sidebar.selectbox("Car Brand", available_brands)
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        year = st.number_input("Year", 1990, CURRENT_YEAR, 2015)
-        km_driven = st.number_input("Kilometers", 0, 500000, 50000, step=1000)
-        fuel_type = st.selectbox("Fuel", ["Petrol", "Diesel", "CNG", "LPG", "Electric"])
-        transmission = st.selectbox("Transmission", ["Manual", "Automatic"])
-        
-    with col2:
-        owner_type = st.selectbox("Owner", ["First", "Second", "Third", "Fourth & Above"])
-        mileage = st.number_input("Mileage (kmpl)", 5.0, 50.0, 18.0)
-        engine_cc = st.number_input("Engine CC", 600, 6000, 1500)
-        power_bhp = st.number_input("Power (BHP)", 20.0, 800.0, 100.0)
-        seats = st.number_input("Seats", 2, 10, 5)
-
-    # 4. Preprocessing Adapter (The Fix)
-    if st.button("Calculate Price"):
-        try:
-            # Step A: Create Raw DataFrame
-            raw_data = pd.DataFrame({
-                'Year': [year],
-                'Kilometers_Driven': [km_driven],
-                'Fuel_Type': [fuel_type],
-                'Transmission': [transmission],
-                'Owner_Type': [owner_type],
-                'Mileage': [mileage],
-                'Engine': [engine_cc],
-                'Power': [power_bhp],
-                'Seats': [seats],
-                'Brand': [brand] # Added Brand
-            })
-
-            # Step B: Feature Engineering (BHP_per_CC)
-            # We catch division by zero just in case
-            raw_data['BHP_per_CC'] = raw_data['Power'] / raw_data['Engine']
-            
-            # Step C: Car Age
-            raw_data['Car_Age'] = CURRENT_YEAR - raw_data['Year']
-
-            # Step D: One-Hot Encoding (The Magic Step)
-            # We convert our single row into OHE columns (Brand_Audi=1, Fuel_Diesel=1)
-            data_encoded = pd.get_dummies(raw_data)
-
-            # Step E: Alignment with Model Schema
-            # This is the most critical line. It forces our data to match the model's expected columns EXACTLY.
-            # 1. model.feature_names_in_ gives the exact list of columns the model wants.
-            # 2. reindex creates missing columns (fill_value=0) and drops extra ones.
-            model_columns = model.feature_names_in_
-            data_final = data_encoded.reindex(columns=model_columns, fill_value=0)
-
-            # Step F: Predict
-            prediction = model.predict(data_final)[0]
-            st.success(f"💰 Estimated Price: {prediction:.2f} Lakhs")
-            
-            # Debug info (Optional, helps verify alignment)
-            with st.expander("Technical Debug Info"):
-                st.write("Aligned Features:", data_final.columns.tolist())
-                st.write("Data sent to model:", data_final)
+    # 2. User Inputs
+    # Every vehicle input lives in the form: edits don't rerun the script
+    # until the submit button is pressed
+    with st.form("car_inputs"):
+        st.subheader("Vehicle Details")
+
+        # Critical Missing Input: Brand
+        brand = st.selectbox("Car Brand", available_brands)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            year = st.number_input("Year", MIN_YEAR, current_year, 2015)
+            km_driven = st.number_input("Kilometers", 0, 500000, 50000, step=1000)
+            fuel_type = st.selectbox("Fuel", ["Petrol", "Diesel", "CNG", "LPG", "Electric"])
+            transmission = st.selectbox("Transmission", ["Manual", "Automatic"])
 
-        except Exception as e:
-            st.error(f"Processing Error: {str(e)}")
-            st.warning("Tip: This error usually means the input data structure doesn't match the training data.")
+        with col2:
+            owner_type = st.selectbox("Owner", ["First", "Second", "Third", "Fourth & Above"])
+            mileage = st.number_input("Mileage (kmpl)", 5.0, 50.0, 18.0)
+            engine_cc = st.number_input("Engine CC", 600, 6000, 1500)
+            power_bhp = st.number_input("Power (BHP)", 20.0, 800.0, 100.0)
+            seats = st.number_input("Seats", 2, 10, 5)
+
+        compare_years = st.checkbox(f"Compare nearby years (±{COMPARE_YEARS_SPAN})")
+        # Part of the form so toggling it doesn't rerun away the shown price;
+        # it takes effect together with the prediction it explains
+        debug = st.checkbox("Show debug info", value=False)
+        submitted = st.form_submit_button("Calculate Price")
+
+    # 3. Preprocessing Adapter (The Fix)
+    if submitted:
+        # No try/except here: numeric inputs are bounded by their widgets (Engine
+        # CC >= 600, so no division by zero), unseen categories simply have no
+        # column, and the brand dropdown is built from brand_encoding, which is
+        # validated in load_brand_encoding. Anything else is a bug and goes to
+        # Streamlit's own exception display.
+        # Step A: Preallocate the aligned input row
+        # Every column of the model schema starts at 0, which is exactly what
+        # get_dummies + reindex(fill_value=0) used to produce for unset columns.
+        row = np.zeros((1, len(model_columns)), dtype=FEATURE_DTYPE)
+
+        # Step B: Numeric features, incl. engineered BHP_per_CC and Car_Age
+        numeric_values = {
+            'Year': year,
+            'Kilometers_Driven': km_driven,
+            'Mileage': mileage,
+            'Engine': engine_cc,
+            'Power': power_bhp,
+            'Seats': seats,
+            'BHP_per_CC': power_bhp / engine_cc,
+            'Car_Age': current_year - year,
+        }
+        for name, value in numeric_values.items():
+            idx = feature_index.get(name)
+            if idx is not None:
+                row[0, idx] = value
+
+        # Step C: One-Hot Encoding by index (Brand_Audi=1, Fuel_Type_Diesel=1)
+        # Categories the model never saw have no column and are skipped,
+        # the same way reindex used to drop them.
+        categorical_values = {
+            'Fuel_Type': fuel_type,
+            'Transmission': transmission,
+            'Owner_Type': owner_type,
+        }
+        for feature, value in categorical_values.items():
+            idx = category_index[feature].get(value)
+            if idx is not None:
+                row[0, idx] = 1.0
+
+        # Brand: one-hot, or the compact encoding shipped with the model
+        brand_columns, brand_values = brand_encoding[brand]
+        row[0, brand_columns] = brand_values
+
+        # Step D: Predict
+        if isinstance(model, SklearnPredictor):
+            prediction = cached_predict(model, tuple(row.ravel().tolist()))
+        else:
+            prediction = float(model.predict(row)[0])
+        st.success(f"💰 Estimated Price: {prediction:.2f} Lakhs")
+
+        # Step E: What-if scenarios, batched into a single predict call
+        # Copies of the row that only differ in Year (and the derived Car_Age)
+        if compare_years:
+            years = np.arange(max(MIN_YEAR, year - COMPARE_YEARS_SPAN), min(current_year, year + COMPARE_YEARS_SPAN) + 1)
+            rows = np.tile(row, (len(years), 1))
+            if 'Year' in feature_index:
+                rows[:, feature_index['Year']] = years
+            if 'Car_Age' in feature_index:
+                rows[:, feature_index['Car_Age']] = current_year - years
+            prices = model.predict(rows)
+            st.line_chart(pd.DataFrame({'Estimated Price (Lakhs)': prices}, index=pd.Index(years, name='Year')))
+
+        # Debug info (Optional, helps verify alignment)
+        # Off by default: rendering the full aligned row means shipping it to the browser as Arrow
+        if debug:
+            with st.expander("Technical Debug Info"):
+                st.write("Aligned Features:", model_columns.tolist())
+                # Only the non-zero slots; the rest of the row is 0 by construction
+                filled = np.flatnonzero(row[0])
+                st.write("Data sent to model:", dict(zip(model_columns[filled].tolist(), row[0, filled].tolist())))
 
 if __name__ == "__main__":
     main()
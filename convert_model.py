@@ -0,0 +1,119 @@
+"""
+Offline conversion of the pickled RandomForestRegressor into faster
+inference artifacts picked up by car_price_app.py when present.
+
+Usage (once per retrained model, on the deployment platform):
+    pip install skl2onnx treelite tl2cgen pandas
+    python convert_model.py
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+import tl2cgen
+import treelite
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+
+MODEL_FILENAME = "car_price_model_rf.pkl"
+ONNX_MODEL_FILENAME = "car_price_model_rf.onnx"
+COMPILED_MODEL_FILENAME = "car_price_model_rf.so"
+COMPILED_DIGEST_FILENAME = COMPILED_MODEL_FILENAME + ".sha256"
+DATA_FILENAME = "CARPRICE.csv"
+
+def model_digest():
+    """
+    SHA-256 of the pickled model. Stored with every converted artifact so the
+    app can tell an artifact built from an older forest with the same columns.
+    """
+    digest = hashlib.sha256()
+    with open(MODEL_FILENAME, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def convert_to_onnx(model, digest):
+    """
+    Converting the forest to ONNX with a float32 input of the model's width.
+    The training feature names and the pickle's digest are stored as metadata
+    so the app can detect a stale artifact and keep using its cached schema.
+    """
+    initial_type = [("input", FloatTensorType([None, model.n_features_in_]))]
+    onnx_model = convert_sklearn(model, initial_types=initial_type)
+
+    meta = onnx_model.metadata_props.add()
+    meta.key = "feature_names"
+    meta.value = json.dumps(model.feature_names_in_.tolist())
+    meta = onnx_model.metadata_props.add()
+    meta.key = "model_sha256"
+    meta.value = digest
+
+    with open(ONNX_MODEL_FILENAME, "wb") as f:
+        f.write(onnx_model.SerializeToString())
+    print(f"Saved {ONNX_MODEL_FILENAME}")
+
+def load_training_matrix(model):
+    """
+    Rebuilding the notebook's feature matrix from the raw CSV, aligned to the
+    model schema. Only used to annotate branch frequencies, so rows the
+    notebook would have dropped are simply zero-filled.
+    """
+    df = pd.read_csv(DATA_FILENAME)
+    words = df['Name'].str.split()
+    df['Brand'] = words.str[0]
+    df['Model'] = words.str[1:3].str.join(' ')
+
+    df['Mileage_num'] = df['Mileage']
+    df['Engine_num'] = df['Engine']
+    df['Power_num'] = df['Power']
+    df['Price_per_CC'] = df['Price'] / df['Engine']
+    df['Price_per_BHP'] = df['Price'] / df['Power']
+    df['BHP_per_CC'] = df['Power'] / df['Engine']
+    df['Car_Age'] = 2025 - df['Year']
+    df['Mileage_CC'] = df['Mileage'] * df['Engine']
+    df = df.drop(columns=['Name', 'Price'])
+
+    X = pd.get_dummies(df, drop_first=True).reindex(columns=model.feature_names_in_, fill_value=0)
+    X = X.replace([np.inf, -np.inf], np.nan).fillna(0)
+    return X.to_numpy(dtype=np.float32)
+
+def compile_to_native(model, digest):
+    """
+    Compiling the forest to a shared library with Treelite + TL2cgen.
+    Thresholds are quantized to integer bin indices and branches annotated
+    with training frequencies, which shrinks the node tables walked per
+    predict. The .so is platform specific, so build it where the app runs.
+    A shared library has no metadata slot, so the pickle's digest goes into
+    a sidecar file next to it.
+    """
+    treelite_model = treelite.sklearn.import_model(model)
+    dmat = tl2cgen.DMatrix(load_training_matrix(model))
+    with tempfile.TemporaryDirectory() as tmp:
+        annotation_path = os.path.join(tmp, "annotation.json")
+        tl2cgen.annotate_branch(treelite_model, dmat, annotation_path)
+        tl2cgen.export_lib(
+            treelite_model,
+            toolchain="gcc",
+            libpath=COMPILED_MODEL_FILENAME,
+            params={
+                "parallel_comp": 32,
+                "quantize": 1,
+                "annotate_in": annotation_path,
+            },
+        )
+    with open(COMPILED_DIGEST_FILENAME, "w") as f:
+        f.write(digest)
+    print(f"Saved {COMPILED_MODEL_FILENAME}")
+
+def main():
+    model = joblib.load(MODEL_FILENAME)
+    digest = model_digest()
+    convert_to_onnx(model, digest)
+    compile_to_native(model, digest)
+
+if __name__ == "__main__":
+    main()